@@ -1,9 +1,10 @@
 import os
 import sys
 import subprocess
-import multiprocessing
+import concurrent.futures
+import contextlib
 import threading
-import re
+from collections import deque
 from pathlib import Path
 
 import yt_dlp
@@ -15,7 +16,7 @@ from PyQt5.QtWidgets import (
     QLineEdit,
     QComboBox,
     QPushButton,
-    QTextEdit,
+    QPlainTextEdit,
     QApplication,
     QFileDialog,
     QSpinBox,
@@ -79,7 +80,7 @@ DARK_THEME = """
     QScrollBar::add-page:vertical, QScrollBar::sub-page:vertical {
         background: transparent;
     }
-    QLineEdit, QComboBox, QTextEdit, QPushButton, QSpinBox {
+    QLineEdit, QComboBox, QPlainTextEdit, QPushButton, QSpinBox {
         background-color: #1a1a1a;
         color: #ffffff;
         border: 2px solid #2281c9;
@@ -95,7 +96,7 @@ DARK_THEME = """
     QPushButton:hover {
         background-color: #1a6aa3;
     }
-    QTextEdit {
+    QPlainTextEdit {
         border: 2px solid #2281c9;
         border-radius: 5px;
     }
@@ -110,61 +111,169 @@ def get_download_folder():
     return os.path.join(Path.home(), "Downloads")
 
 
+# Log messages are sent to the GUI in batches of at most this many
+LOG_BATCH_SIZE = 32
+# Seconds a message may wait in the buffer before it is sent
+LOG_FLUSH_INTERVAL = 0.25
+# Oldest log lines are dropped beyond this many
+LOG_MAX_LINES = 10000
+# Subfolder of the destination holding downloads until they are converted
+TEMP_DIR_NAME = ".ytdownloader-temp"
+
+
 def sanitize_filename(name):
-    # Remove characters that are unsafe for filenames.
-    return re.sub(r'[\\/*?:"<>|]', "", name)
+    # Use yt-dlp's own sanitizing (unsafe characters become full-width
+    # look-alikes) so names match files saved with its '%(title)s' template.
+    return yt_dlp.utils.sanitize_filename(name)
+
+
+def _ffmpeg_threads_per_invocation(n_workers):
+    # Split the CPUs between concurrent ffmpeg runs so they don't oversubscribe.
+    return max(1, (os.cpu_count() or n_workers) // n_workers)
+
+
+# ffmpeg encoder arguments for each output format
+_FFMPEG_CODEC_ARGS = {
+    'mp3': ['-c:a', 'libmp3lame', '-b:a', '192k'],
+    'wav': ['-c:a', 'pcm_s16le', '-ac', '2'],
+    'm4a': ['-c:a', 'aac', '-b:a', '192k'],
+    'opus': ['-c:a', 'libopus', '-b:a', '192k'],
+}
+
+# yt-dlp stream selectors that prefer audio already in the target codec
+_FORMAT_SELECTORS = {
+    'mp3': 'bestaudio/best',
+    'wav': 'bestaudio/best',
+    'm4a': 'bestaudio[ext=m4a]/bestaudio/best',
+    'opus': 'bestaudio[acodec=opus]/bestaudio/best',
+}
+
+# Source codec that can be copied into each output format as is
+_COPYABLE_CODECS = {
+    'mp3': 'mp3',
+    'm4a': 'mp4a',
+    'opus': 'opus',
+}
+
+# Keep ffmpeg from flashing a console window in the Windows GUI build
+_SUBPROCESS_FLAGS = subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0
+
+# Per-thread state for the download workers
+_worker = threading.local()
+
+
+def _init_worker(fmt, temp_dir, instances):
+    """
+    Thread pool initializer: builds one YoutubeDL per worker thread so the
+    extractors and player cache are reused for every video it downloads.
+    The instance is also added to instances so it can be closed later.
+    """
+    ydl_opts = {
+        'format': _FORMAT_SELECTORS[fmt],
+        # Files are named after the video id until they are converted
+        'outtmpl': os.path.join(temp_dir, '%(id)s.download.%(ext)s'),
+        'overwrites': False,
+        # Fetch fragmented (DASH/HLS) streams a few pieces at a time, kept
+        # small so one video doesn't starve the other download threads
+        'concurrent_fragment_downloads': 4,
+        'quiet': True,
+        'no_warnings': True,
+    }
+    _worker.ydl = yt_dlp.YoutubeDL(ydl_opts)
+    instances.append(_worker.ydl)
 
 
 def download_video(args):
     """
-    Downloads a video's audio stream using yt-dlp.
-    Args should be a tuple of (video_url, fmt, output_path, idx, total)
+    Downloads a video's audio stream using the worker's yt-dlp instance.
+    Args should be a tuple of
+    (video_url, title, fmt, output_path, existing, idx, total)
+    where existing is the set of file names already in output_path.
+    Returns (download, message): download is yt-dlp's info for the
+    downloaded stream (with its filepath and acodec), or None with a log
+    message if the video was skipped or failed.
     """
-    video_url, fmt, output_path, idx, total = args
+    video_url, title, fmt, output_path, existing, idx, total = args
     
     try:
-        # Configure yt-dlp options
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'outtmpl': os.path.join(output_path, '%(title)s.%(ext)s'),
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': fmt,
-                'preferredquality': '192',
-            }],
-            'quiet': True,
-            'no_warnings': True,
-        }
+        # The title from the playlist scan decides the file name, so we can
+        # check for an existing file without asking yt-dlp first
+        if f"{sanitize_filename(title)}.{fmt}" in existing:
+            return None, f"Skipped {title} {idx}/{total}"
         
-        # Get info first to check if file exists
-        with yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True}) as ydl:
-            info = ydl.extract_info(video_url, download=False)
-            title = info.get('title', 'video')
-            sanitized_title = sanitize_filename(title)
-            target_file = os.path.join(output_path, f"{sanitized_title}.{fmt}")
-            
-            if os.path.exists(target_file):
-                return f"Skipped {title} {idx}/{total}"
-            
-            # Download the video
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([video_url])
-                
-            return f"Downloaded {title} {idx}/{total}"
+        # Download the audio stream, conversion happens separately
+        info = _worker.ydl.extract_info(video_url, download=True)
+        return info['requested_downloads'][0], None
     except Exception as e:
-        return f"Error processing {video_url} ({idx}/{total}): {e}"
+        return None, f"Error processing {video_url} ({idx}/{total}): {e}"
+
+
+def convert_audio(args):
+    """
+    Converts a downloaded audio file to the target format with ffmpeg and
+    removes the source file. If the source is already in the target codec
+    the stream is copied instead of re-encoded. ffmpeg writes next to the
+    source and the result is only moved to the target name once complete,
+    so a failed conversion never touches an existing file.
+    Args should be a tuple of
+    (source_file, source_codec, title, fmt, output_path, ffmpeg_threads, idx, total)
+    """
+    source_file, source_codec, title, fmt, output_path, ffmpeg_threads, idx, total = args
+    target_file = os.path.join(output_path, f"{sanitize_filename(title)}.{fmt}")
+    partial_file = f"{os.path.splitext(source_file)[0]}.converted.{fmt}"
+    
+    # Codec strings look like "mp4a.40.2", only the family matters here
+    if (source_codec or "").split(".")[0] == _COPYABLE_CODECS.get(fmt):
+        codec_args = ["-c:a", "copy"]
+    else:
+        codec_args = _FFMPEG_CODEC_ARGS[fmt]
+    
+    # -threads is given for both decoding and encoding
+    command = [
+        "ffmpeg", "-y", "-nostdin", "-loglevel", "error",
+        "-threads", str(ffmpeg_threads),
+        "-i", source_file,
+        "-vn", *codec_args,
+        "-threads", str(ffmpeg_threads),
+        partial_file,
+    ]
+    
+    try:
+        # Only errors are printed; they are collected for the log message
+        subprocess.run(
+            command,
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            # ffmpeg prints UTF-8 regardless of the locale (e.g. paths)
+            encoding="utf-8",
+            errors="replace",
+            creationflags=_SUBPROCESS_FLAGS,
+        )
+        os.replace(partial_file, target_file)
+        return f"Downloaded {title} {idx}/{total}"
+    except Exception as e:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(partial_file)
+        # Prefer ffmpeg's own error text over the bare exit status
+        error = (getattr(e, "stderr", None) or "").strip() or e
+        return f"Error converting {title} ({idx}/{total}): {error}"
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(source_file)
 
 
 def get_playlist_videos(playlist_url):
     """
-    Gets all video URLs from a playlist.
+    Gets (video_url, title) pairs for all videos in a playlist. Videos that
+    appear more than once are only listed the first time.
     """
     try:
         # Configure yt-dlp options for playlist extraction
         ydl_opts = {
             'quiet': True,
             'no_warnings': True,
-            'extract_flat': True,  # Don't download videos, just get info
+            'extract_flat': 'in_playlist',  # Only list entries, keeping their titles
             'ignoreerrors': True,  # Skip unavailable videos
         }
         
@@ -175,9 +284,14 @@ def get_playlist_videos(playlist_url):
                 return [], ""
             
             videos = []
+            seen_ids = set()
             for entry in playlist_info['entries']:
-                if entry:
-                    videos.append(f"https://www.youtube.com/watch?v={entry['id']}")
+                if entry and entry['id'] not in seen_ids:
+                    seen_ids.add(entry['id'])
+                    videos.append((
+                        f"https://www.youtube.com/watch?v={entry['id']}",
+                        entry.get('title') or entry['id'],
+                    ))
             
             playlist_title = playlist_info.get('title', 'YouTube Playlist')
             return videos, playlist_title
@@ -186,12 +300,15 @@ def get_playlist_videos(playlist_url):
 
 
 class DownloaderWidget(QWidget):
-    log_signal = pyqtSignal(str)
+    log_signal = pyqtSignal(list)
     finished_signal = pyqtSignal(str, int)
 
     def __init__(self):
         super().__init__()
         self.selected_directory = get_download_folder()
+        self._log_buffer = deque()
+        self._log_lock = threading.Lock()
+        self._log_timer = None
         self.init_ui()
         self.log_signal.connect(self.append_log)
         self.finished_signal.connect(self.on_finished)
@@ -214,13 +331,28 @@ class DownloaderWidget(QWidget):
         format_layout.addWidget(format_label)
         format_layout.addWidget(self.format_combo)
         
-        # Number of processes to use
-        processes_label = QLabel("Processes:")
+        # Number of download threads to use
+        processes_label = QLabel("Threads:")
         self.processes_spin = QSpinBox()
-        self.processes_spin.setRange(1, multiprocessing.cpu_count())
-        self.processes_spin.setValue(min(8, multiprocessing.cpu_count()))
+        self.processes_spin.setRange(1, os.cpu_count() or 1)
+        self.processes_spin.setValue(min(8, os.cpu_count() or 1))
         format_layout.addWidget(processes_label)
         format_layout.addWidget(self.processes_spin)
+
+        # Threads each ffmpeg conversion may use
+        ffmpeg_threads_label = QLabel("FFmpeg threads:")
+        self.ffmpeg_threads_spin = QSpinBox()
+        self.ffmpeg_threads_spin.setRange(1, os.cpu_count() or 1)
+        self.ffmpeg_threads_spin.setValue(
+            _ffmpeg_threads_per_invocation(self.processes_spin.value())
+        )
+        self.processes_spin.valueChanged.connect(
+            lambda value: self.ffmpeg_threads_spin.setValue(
+                _ffmpeg_threads_per_invocation(value)
+            )
+        )
+        format_layout.addWidget(ffmpeg_threads_label)
+        format_layout.addWidget(self.ffmpeg_threads_spin)
         
         layout.addLayout(format_layout)
 
@@ -241,8 +373,9 @@ class DownloaderWidget(QWidget):
         layout.addWidget(self.download_button)
 
         # Text area to display log messages.
-        self.log_text = QTextEdit()
+        self.log_text = QPlainTextEdit()
         self.log_text.setReadOnly(True)
+        self.log_text.setMaximumBlockCount(LOG_MAX_LINES)
         layout.addWidget(self.log_text)
 
         self.setLayout(layout)
@@ -256,25 +389,51 @@ class DownloaderWidget(QWidget):
             self.destination_input.setText(directory)
             self.selected_directory = directory
 
-    def append_log(self, message):
-        self.log_text.append(message)
+    def append_log(self, messages):
+        # Append the whole batch with a single layout pass
+        self.log_text.setUpdatesEnabled(False)
+        self.log_text.appendPlainText("\n".join(messages))
+        self.log_text.setUpdatesEnabled(True)
         # Auto-scroll to the bottom
-        cursor = self.log_text.textCursor()
-        cursor.movePosition(cursor.End)
-        self.log_text.setTextCursor(cursor)
+        scroll_bar = self.log_text.verticalScrollBar()
+        scroll_bar.setValue(scroll_bar.maximum())
+
+    def log(self, message):
+        # Queue a message for the GUI; safe to call from any thread
+        with self._log_lock:
+            self._log_buffer.append(message)
+            if len(self._log_buffer) >= LOG_BATCH_SIZE:
+                self._flush_log_locked()
+            elif self._log_timer is None:
+                self._log_timer = threading.Timer(LOG_FLUSH_INTERVAL, self.flush_log)
+                self._log_timer.daemon = True
+                self._log_timer.start()
+
+    def flush_log(self):
+        with self._log_lock:
+            self._flush_log_locked()
+
+    def _flush_log_locked(self):
+        if self._log_timer is not None:
+            self._log_timer.cancel()
+            self._log_timer = None
+        if self._log_buffer:
+            self.log_signal.emit(list(self._log_buffer))
+            self._log_buffer.clear()
 
     def start_download(self):
         url = self.url_input.text().strip()
         if not url:
-            self.append_log("Please enter a valid URL.")
+            self.append_log(["Please enter a valid URL."])
             return
 
         fmt = self.format_combo.currentText().lower()
         processes = self.processes_spin.value()
+        ffmpeg_threads = self.ffmpeg_threads_spin.value()
 
         # Disable the download button while downloading.
         self.download_button.setEnabled(False)
-        self.append_log("Starting download...")
+        self.append_log(["Starting download..."])
 
         # Use the user-selected directory.
         dir_path = self.destination_input.text()
@@ -285,41 +444,120 @@ class DownloaderWidget(QWidget):
 
         # Start the download in a background thread.
         thread = threading.Thread(
-            target=self.download_thread, args=(url, fmt, dir_path, processes)
+            target=self.download_thread,
+            args=(url, fmt, dir_path, processes, ffmpeg_threads),
         )
         thread.daemon = True
         thread.start()
 
-    def download_thread(self, url, fmt, dir_path, processes):
+    def download_thread(self, url, fmt, dir_path, processes, ffmpeg_threads):
         # Get videos from playlist
-        self.log_signal.emit("Loading playlist...")
+        self.log("Loading playlist...")
         videos, playlist_title = get_playlist_videos(url)
         
         if not videos:
-            self.log_signal.emit("No videos found in playlist.")
+            self.log("No videos found in playlist.")
+            self.flush_log()
             self.finished_signal.emit("", 0)
             return
         
         total = len(videos)
-        self.log_signal.emit(f"Found {total} videos in playlist: {playlist_title}")
+        self.log(f"Found {total} videos in playlist: {playlist_title}")
+        
+        # Scan the folder once instead of checking every file separately
+        with os.scandir(dir_path) as entries:
+            existing = {entry.name for entry in entries if entry.is_file()}
+        
+        # Downloads wait for conversion in a private subfolder; anything
+        # left there comes from an interrupted run and is removed
+        temp_dir = os.path.join(dir_path, TEMP_DIR_NAME)
+        try:
+            os.makedirs(temp_dir, exist_ok=True)
+        except OSError as e:
+            self.log(f"Could not create temporary folder {temp_dir}: {e}")
+            self.flush_log()
+            self.finished_signal.emit("", 0)
+            return
+        with os.scandir(temp_dir) as entries:
+            for entry in entries:
+                try:
+                    os.unlink(entry.path)
+                except OSError as e:
+                    self.log(f"Could not remove leftover file {entry.path}: {e}")
         
-        # Prepare arguments for multiprocessing
+        # Prepare arguments for the worker threads
         args_list = [
-            (video_url, fmt, dir_path, idx, total)
-            for idx, video_url in enumerate(videos, start=1)
+            (video_url, title, fmt, dir_path, existing, idx, total)
+            for idx, (video_url, title) in enumerate(videos, start=1)
         ]
         
-        # Use multiprocessing to download videos
-        self.log_signal.emit(f"Starting download with {processes} processes...")
+        # Downloads are network bound, so threads are enough. Conversions
+        # run in their own pool sized to the CPUs, so the next downloads
+        # continue while ffmpeg works on the finished ones.
+        converters = max(1, (os.cpu_count() or 1) // ffmpeg_threads)
+        self.log(
+            f"Starting download with {processes} threads "
+            f"and {converters} conversions at a time..."
+        )
         
-        with multiprocessing.Pool(processes=processes) as pool:
-            # Process results as they arrive
-            for result in pool.imap_unordered(download_video, args_list):
-                self.log_signal.emit(result)
+        ydl_instances = []
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=converters) as convert_pool:
+                with concurrent.futures.ThreadPoolExecutor(
+                    max_workers=processes,
+                    initializer=_init_worker,
+                    initargs=(fmt, temp_dir, ydl_instances),
+                ) as download_pool:
+                    futures = {
+                        download_pool.submit(download_video, args): args
+                        for args in args_list
+                    }
+                    # Queue conversions as downloads finish
+                    for future in concurrent.futures.as_completed(futures):
+                        download, message = future.result()
+                        if download is None:
+                            self.log(message)
+                            continue
+                    
+                        _, title, _, _, _, idx, _ = futures[future]
+                        convert_future = convert_pool.submit(
+                            convert_audio,
+                            (
+                                download['filepath'], download.get('acodec'),
+                                title, fmt, dir_path, ffmpeg_threads, idx, total,
+                            ),
+                        )
+                        convert_future.add_done_callback(
+                            lambda f, title=title, idx=idx: self._log_conversion(
+                                f, title, idx, total
+                            )
+                        )
+        except Exception as e:
+            # e.g. a worker failing to start breaks the pool
+            self.log(f"Download failed: {e}")
+            self.flush_log()
+            self.finished_signal.emit("", 0)
+            return
+        finally:
+            for ydl in ydl_instances:
+                ydl.close()
+        
+        # Only succeeds once every download has been converted
+        with contextlib.suppress(OSError):
+            os.rmdir(temp_dir)
         
-        self.log_signal.emit("Download thread finished.")
+        self.log("Download thread finished.")
+        self.flush_log()
         self.finished_signal.emit(playlist_title, total)
 
+    def _log_conversion(self, future, title, idx, total):
+        # Done-callback exceptions are swallowed, so always log something
+        try:
+            message = future.result()
+        except Exception as e:
+            message = f"Error converting {title} ({idx}/{total}): {e}"
+        self.log(message)
+
     def on_finished(self, playlist_title, total_videos):
         self.download_button.setEnabled(True)
         if playlist_title and total_videos > 0:
@@ -337,10 +575,6 @@ class DownloaderWidget(QWidget):
 
 
 def main():
-    # Required for multiprocessing to work properly on Windows
-    if sys.platform.startswith('win'):
-        multiprocessing.freeze_support()
-    
     app = QApplication(sys.argv)
     app.setStyleSheet(DARK_THEME)
 